@@ -0,0 +1,20 @@
+"""
+actions.py
+
+Defines the lightweight Action record that agents return from `act` and
+the environment consumes in `MarketEnvironment.step`.
+"""
+
+from collections import namedtuple
+
+# Action type codes and trade directions live with the kernels that use them
+from kernels import NONE, TRADE, ADD_LIQUIDITY, REMOVE_LIQUIDITY, BUY, SELL
+
+# type_code: one of the codes above
+# amount_a:  trade size, Token A deposit, or fraction of liquidity to remove
+# amount_b:  Token B deposit, or fraction of liquidity to remove
+# direction: BUY / SELL for trades, 0 otherwise
+Action = namedtuple("Action", ["type_code", "amount_a", "amount_b", "direction"])
+
+# Shared "do nothing" action, so idle agents don't allocate every step
+NOOP = Action(NONE, 0.0, 0.0, 0)
@@ -2,22 +2,56 @@
 agents.py
 
 Defines the different agent classes (ArbitrageBot, RandomTrader,
-BasicLiquidityProvider, RLLiquidityProvider) that will act in the simulation.
+BasicLiquidityProvider, RLLiquidityProvider) that will act in the simulation,
+plus vectorized pools (RandomTraderPool, ArbitrageBotPool) for running many
+identical agents at once.
 """
 
 import numpy as np
 
+from actions import Action, NOOP, NONE, TRADE, BUY, SELL
+from kernels import (KERNEL_ARBITRAGE_BOT, KERNEL_RANDOM_TRADER, KERNEL_BASIC_LP, KERNEL_RL_LP,
+                     _arb_decide, _random_trader_decide, _basiclp_decide)
+
+# `act` runs the decide kernels' plain-Python source: the fused simulation
+# uses the compiled versions, and calling into Numba from Python for a
+# single decision costs more than the decision itself.
+_arb_decide_py = _arb_decide.py_func
+_random_trader_decide_py = _random_trader_decide.py_func
+_basiclp_decide_py = _basiclp_decide.py_func
+
+
 class BaseAgent:
     """
     Abstract base class for agents. Agents must implement the `act` method,
-    which returns a dictionary describing the action.
+    which returns an `Action` describing the action.
+
+    Agents that can run inside the fused `kernels.simulate` kernel also
+    override `kernel_params`, returning (kind, p0, p1, p2) with `kind` one of
+    the KERNEL_* codes from kernels.py. Agents that draw random numbers override
+    `kernel_rng` to hand their Generator to the kernel, and agents with state
+    the kernel updates override `kernel_writeback` to read it back.
     """
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
     def act(self, env_state):
         raise NotImplementedError
 
+    def kernel_params(self):
+        return None
+
+    def kernel_rng(self):
+        return None
+
+    def kernel_writeback(self, params):
+        """
+        Called after a fused run with this agent's final (p0, p1, p2) row.
+        """
+        pass
+
 
 class ArbitrageBot(BaseAgent):
     """
@@ -25,39 +59,22 @@ class ArbitrageBot(BaseAgent):
     the AMM price and the reference market price. If profitable, it trades
     to exploit the discrepancy.
     """
+    __slots__ = ("threshold", "max_trade_size")
+
     def __init__(self, name, threshold=0.001, max_trade_size=10.0):
         super().__init__(name)
         self.threshold = threshold  # E.g., 0.1% threshold
         self.max_trade_size = max_trade_size
 
     def act(self, env_state):
-        amm_price = env_state["amm_price"]
-        ref_price = env_state["reference_price"]
-
-        # If amm_price is near zero, skip to avoid divide-by-zero in price_diff / amm_price
-        if amm_price < 1e-12:
-            return {"type": "none", "amount": 0.0}
-
-        price_diff = ref_price - amm_price
-        relative_diff = price_diff / amm_price
-
-        action = {
-            "type": "none",
-            "amount": 0.0
-        }
-
-        # If reference price > AMM price by threshold => buy from AMM cheaply
-        if relative_diff > self.threshold:
-            action["type"] = "trade"
-            action["amount"] = min(self.max_trade_size, abs(price_diff) * 10)
-            action["direction"] = "buy"  # Buy Token A, spend Token B
-        # If AMM price > reference price by threshold => sell to AMM
-        elif -relative_diff > self.threshold:
-            action["type"] = "trade"
-            action["amount"] = min(self.max_trade_size, abs(price_diff) * 10)
-            action["direction"] = "sell"  # Sell Token A, receive Token B
+        type_code, amount_a, amount_b, direction = _arb_decide_py(
+            env_state.amm_price, env_state.reference_price, self.threshold, self.max_trade_size)
+        if type_code == NONE:
+            return NOOP
+        return Action(type_code, amount_a, amount_b, direction)
 
-        return action
+    def kernel_params(self):
+        return (KERNEL_ARBITRAGE_BOT, self.threshold, self.max_trade_size, 0.0)
 
 
 class RandomTrader(BaseAgent):
@@ -65,22 +82,26 @@ class RandomTrader(BaseAgent):
     Executes random trades with random directions (buy/sell).
     Useful for adding background noise into the simulation.
     """
-    def __init__(self, name, max_trade_size=5.0, trade_prob=0.5):
+    __slots__ = ("max_trade_size", "trade_prob", "_rng")
+
+    def __init__(self, name, max_trade_size=5.0, trade_prob=0.5, random_seed=None):
         super().__init__(name)
         self.max_trade_size = max_trade_size
         self.trade_prob = trade_prob
+        self._rng = np.random.default_rng(random_seed)
 
     def act(self, env_state):
-        action = {
-            "type": "none",
-            "amount": 0.0
-        }
-        # Decide randomly whether to trade
-        if np.random.rand() < self.trade_prob:
-            action["type"] = "trade"
-            action["amount"] = np.random.rand() * self.max_trade_size
-            action["direction"] = np.random.choice(["buy", "sell"])
-        return action
+        type_code, amount_a, amount_b, direction = _random_trader_decide_py(
+            self._rng, self.max_trade_size, self.trade_prob)
+        if type_code == NONE:
+            return NOOP
+        return Action(type_code, amount_a, amount_b, direction)
+
+    def kernel_params(self):
+        return (KERNEL_RANDOM_TRADER, self.max_trade_size, self.trade_prob, 0.0)
+
+    def kernel_rng(self):
+        return self._rng
 
 
 class BasicLiquidityProvider(BaseAgent):
@@ -88,6 +109,8 @@ class BasicLiquidityProvider(BaseAgent):
     A basic liquidity provider that provides a fixed amount of liquidity
     at the start and does not rebalance unless an extreme condition hits.
     """
+    __slots__ = ("initial_liquidity", "remove_threshold", "has_provided")
+
     def __init__(self, name, initial_liquidity=1000.0, remove_threshold=0.2):
         super().__init__(name)
         self.initial_liquidity = initial_liquidity
@@ -95,32 +118,19 @@ class BasicLiquidityProvider(BaseAgent):
         self.has_provided = False
 
     def act(self, env_state):
-        action = {
-            "type": "none",
-            "amount_tokenA": 0.0,
-            "amount_tokenB": 0.0
-        }
-
-        if not self.has_provided:
-            # Provide liquidity once at the start
-            action["type"] = "add_liquidity"
-            ref_price = env_state["reference_price"]
-            amount_B = self.initial_liquidity * ref_price
-            action["amount_tokenA"] = self.initial_liquidity
-            action["amount_tokenB"] = amount_B
-            self.has_provided = True
-        else:
-            # Possibly remove liquidity if price has changed more than threshold
-            amm_price = env_state["amm_price"]
-            ref_price = env_state["reference_price"]
-            if ref_price > 1e-12:  # avoid zero-division
-                price_diff = abs(amm_price - ref_price) / ref_price
-                if price_diff > self.remove_threshold:
-                    action["type"] = "remove_liquidity"
-                    # remove half the liquidity
-                    action["amount_tokenA"] = 0.5  # fraction
-                    action["amount_tokenB"] = 0.5
-        return action
+        type_code, amount_a, amount_b, direction, self.has_provided = _basiclp_decide_py(
+            env_state.amm_price, env_state.reference_price,
+            self.initial_liquidity, self.remove_threshold, self.has_provided)
+        if type_code == NONE:
+            return NOOP
+        return Action(type_code, amount_a, amount_b, direction)
+
+    def kernel_params(self):
+        # The last slot carries `has_provided` in and out of the kernel
+        return (KERNEL_BASIC_LP, self.initial_liquidity, self.remove_threshold, float(self.has_provided))
+
+    def kernel_writeback(self, params):
+        self.has_provided = bool(params[2])
 
 
 class RLLiquidityProvider(BaseAgent):
@@ -128,6 +138,8 @@ class RLLiquidityProvider(BaseAgent):
     A liquidity provider that uses an external RL policy (Q-table or network)
     to decide how much liquidity to add/remove each step.
     """
+    __slots__ = ("policy",)
+
     def __init__(self, name, policy):
         super().__init__(name)
         self.policy = policy
@@ -136,3 +148,83 @@ class RLLiquidityProvider(BaseAgent):
         # Query policy for an action
         action = self.policy.select_action(env_state)
         return action
+
+    def kernel_params(self):
+        # Only policies that expose their own kernel parameters can be fused
+        if not hasattr(self.policy, "kernel_params"):
+            return None
+        return (KERNEL_RL_LP,) + tuple(self.policy.kernel_params())
+
+    def kernel_rng(self):
+        return self.policy.kernel_rng()
+
+
+class BaseAgentPool:
+    """
+    Abstract base class for a group of identical agents stored as arrays of
+    parameters (struct-of-arrays). Pools must implement `act_batch`, which
+    returns the tuple (type_codes, amounts, directions) of arrays, one entry
+    per member, in the same order as `names`.
+    """
+    __slots__ = ("names",)
+
+    def __init__(self, names):
+        self.names = list(names)
+
+    def act_batch(self, env_state):
+        raise NotImplementedError
+
+
+class RandomTraderPool(BaseAgentPool):
+    """
+    Vectorized equivalent of a list of RandomTrader agents.
+    """
+    __slots__ = ("max_trade_sizes", "trade_probs", "_rng")
+
+    def __init__(self, names, max_trade_size=5.0, trade_prob=0.5, random_seed=None):
+        super().__init__(names)
+        n = len(self.names)
+        self.max_trade_sizes = np.full(n, max_trade_size, dtype=np.float64)
+        self.trade_probs = np.full(n, trade_prob, dtype=np.float64)
+        self._rng = np.random.default_rng(random_seed)
+
+    def act_batch(self, env_state):
+        n = len(self.names)
+        u = self._rng.random((3, n))
+        trade_mask = u[0] < self.trade_probs
+        amounts = u[1] * self.max_trade_sizes
+        directions = np.where(u[2] < 0.5, BUY, SELL).astype(np.int8)
+        type_codes = np.where(trade_mask, TRADE, NONE).astype(np.int8)
+        return type_codes, amounts, directions
+
+
+class ArbitrageBotPool(BaseAgentPool):
+    """
+    Vectorized equivalent of a list of ArbitrageBot agents.
+    """
+    __slots__ = ("thresholds", "max_trade_sizes")
+
+    def __init__(self, names, threshold=0.001, max_trade_size=10.0):
+        super().__init__(names)
+        n = len(self.names)
+        self.thresholds = np.full(n, threshold, dtype=np.float64)
+        self.max_trade_sizes = np.full(n, max_trade_size, dtype=np.float64)
+
+    def act_batch(self, env_state):
+        n = len(self.names)
+        amm_price = env_state.amm_price
+        ref_price = env_state.reference_price
+
+        # If amm_price is near zero, skip to avoid divide-by-zero
+        if amm_price < 1e-12:
+            return np.zeros(n, dtype=np.int8), np.zeros(n), np.zeros(n, dtype=np.int8)
+
+        price_diff = ref_price - amm_price
+        relative_diff = price_diff / amm_price
+
+        # Same sign rule as ArbitrageBot.act: +1 buy, -1 sell, 0 no trade
+        directions = ((relative_diff > self.thresholds).astype(np.int8)
+                      - (relative_diff < -self.thresholds).astype(np.int8))
+        type_codes = (directions != 0).astype(np.int8) * TRADE
+        amounts = np.minimum(self.max_trade_sizes, abs(price_diff) * 10)
+        return type_codes, amounts, directions
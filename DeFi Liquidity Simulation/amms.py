@@ -5,10 +5,13 @@ Implements a simple Constant Product AMM (like Uniswap V2) and a base class
 for potential extensions (e.g., stable-swap, hybrid AMM).
 """
 
+
 class BaseAMM:
     """
     Base class for an AMM.
     """
+    __slots__ = ("fee_rate",)
+
     def __init__(self, fee_rate=0.003):
         self.fee_rate = fee_rate
 
@@ -32,46 +35,37 @@ class ConstantProductAMM(BaseAMM):
     """
     Uniswap v2–style Constant Product Automated Market Maker.
     X * Y = K, where X = reserve of Token A, Y = reserve of Token B.
+    K is not stored; swaps derive it from the current reserves.
     """
+    __slots__ = ("reserveA", "reserveB", "liquidity_shares")
+
     def __init__(self, fee_rate=0.003):
         super().__init__(fee_rate=fee_rate)
         self.reserveA = 0.0
         self.reserveB = 0.0
-        self.K = 0.0
         self.liquidity_shares = 0.0
 
     def add_liquidity(self, amount_tokenA, amount_tokenB):
         """
         Provide liquidity in proportion to the existing ratio of reserves.
         If the pool is empty or effectively empty, treat it as new.
+        Keep in sync with kernels._add_liquidity_kernel.
         """
         # If either reserve is near zero, treat as new pool
         if self.reserveA < 1e-12 or self.reserveB < 1e-12:
             self.reserveA = amount_tokenA
             self.reserveB = amount_tokenB
-            self.K = self.reserveA * self.reserveB
             # For simplicity: mint shares = sum of tokens
             self.liquidity_shares += (amount_tokenA + amount_tokenB)
             return True
 
-        # Otherwise, deposit in the ratio of existing reserves
-        ratioA = amount_tokenA / self.reserveA if self.reserveA != 0 else float('inf')
-        ratioB = amount_tokenB / self.reserveB if self.reserveB != 0 else float('inf')
-
+        # Otherwise, deposit in the ratio of existing reserves.
+        # Uniswap v2 mint: shares scale with the deposit relative to the reserve
+        # *before* it; reserveA >= 1e-12 here, so the division is safe.
         # For realism, you'd revert or adjust if ratioA != ratioB, but let's proceed:
+        shares_minted = self.liquidity_shares * amount_tokenA / self.reserveA
         self.reserveA += amount_tokenA
         self.reserveB += amount_tokenB
-        self.K = self.reserveA * self.reserveB
-
-        # Avoid dividing by zero if self.reserveA == amount_tokenA
-        denominator = (self.reserveA - amount_tokenA)
-        if abs(denominator) < 1e-12:
-            # If the user is depositing all or if pool was tiny, fallback
-            # Just mint a proportion of the existing shares
-            shares_minted = amount_tokenA + amount_tokenB
-        else:
-            shares_minted = (self.liquidity_shares * amount_tokenA) / denominator
-
         self.liquidity_shares += shares_minted
         return True
 
@@ -79,6 +73,7 @@ class ConstantProductAMM(BaseAMM):
         """
         Remove fraction of total liquidity shares.
         Prevent removing 100% to avoid emptying the pool entirely.
+        Keep in sync with kernels._remove_liquidity_kernel.
         """
         # If fraction is too close to 1, limit it
         fraction = min(fraction, 0.999)  # remove up to 99.9%
@@ -93,12 +88,13 @@ class ConstantProductAMM(BaseAMM):
 
         shares_to_burn = self.liquidity_shares * fraction
         self.liquidity_shares -= shares_to_burn
-
-        # Update K
-        self.K = self.reserveA * self.reserveB
         return amountA_out, amountB_out
 
     def swap(self, amount_in, direction):
+        """
+        direction > 0 (BUY): user inputs Token B and receives Token A.
+        direction < 0 (SELL): user inputs Token A and receives Token B.
+        """
         if amount_in <= 0:
             return 0.0
 
@@ -106,30 +102,28 @@ class ConstantProductAMM(BaseAMM):
         if self.reserveA < 1e-12 or self.reserveB < 1e-12:
             return 0.0
 
-        if direction == "buy":
+        # Plain Python on purpose: for a few FLOPs, calling into Numba costs
+        # more than the math. Keep in sync with kernels._swap_kernel, which
+        # the fused simulation loop uses.
+        reserveA = self.reserveA
+        reserveB = self.reserveB
+        # K is only needed here, so it's derived from the reserves rather than stored
+        K = reserveA * reserveB
+        amount_in_after_fee = amount_in * (1.0 - self.fee_rate)
+        if direction > 0:
             # user inputs B, gets A
-            amount_in_after_fee = amount_in * (1 - self.fee_rate)
-            new_reserveB = self.reserveB + amount_in_after_fee
+            new_reserveB = reserveB + amount_in_after_fee
             # x * y = k => x = K / y
-            new_reserveA = self.K / new_reserveB if new_reserveB != 0 else 0
-            amount_out = self.reserveA - new_reserveA
-            if amount_out < 0:
-                amount_out = 0
-            self.reserveB = new_reserveB
-            self.reserveA = new_reserveA
+            new_reserveA = K / new_reserveB if new_reserveB != 0.0 else 0.0
+            amount_out = reserveA - new_reserveA
         else:
-            # direction == "sell"
-            amount_in_after_fee = amount_in * (1 - self.fee_rate)
-            new_reserveA = self.reserveA + amount_in_after_fee
-            new_reserveB = self.K / new_reserveA if new_reserveA != 0 else 0
-            amount_out = self.reserveB - new_reserveB
-            if amount_out < 0:
-                amount_out = 0
-            self.reserveA = new_reserveA
-            self.reserveB = new_reserveB
-
-        self.K = self.reserveA * self.reserveB
-        return amount_out
+            # user inputs A, gets B
+            new_reserveA = reserveA + amount_in_after_fee
+            new_reserveB = K / new_reserveA if new_reserveA != 0.0 else 0.0
+            amount_out = reserveB - new_reserveB
+        self.reserveA = new_reserveA
+        self.reserveB = new_reserveB
+        return amount_out if amount_out > 0.0 else 0.0
 
     def get_price(self):
         if self.reserveA < 1e-12:
@@ -6,20 +6,31 @@ def generate_synthetic_price_series(num_steps=1000,
                                     start_price=1.0,
                                     drift=0.0,
                                     volatility=0.01,
-                                    random_seed=None):
+                                    random_seed=None,
+                                    dtype=np.float32):
     """
     Generates a synthetic price series using geometric Brownian motion.
-    If 'random_seed' is provided, we set the global NumPy RNG seed temporarily,
-    which makes the output reproducible. If 'random_seed' is None,
-    it uses whatever the current global random state is (fully random).
+    Shocks are drawn from a PCG64 Generator seeded with 'random_seed', so
+    the output is reproducible when it's provided. If 'random_seed' is None,
+    the generator is seeded from fresh OS entropy (fully random).
+    The global NumPy RNG state is never touched.
+    The path is accumulated in float64 and stored as 'dtype' (float32 by
+    default, which is plenty for the simulation's relative price checks).
     """
-    if random_seed is not None:
-        np.random.seed(random_seed)
+    rng = np.random.default_rng(random_seed)
 
-    prices = np.zeros(num_steps)
+    prices = np.empty(num_steps, dtype=dtype)
     prices[0] = start_price
-    for t in range(1, num_steps):
-        shock = np.random.normal(0, 1)
-        prices[t] = prices[t - 1] * np.exp((drift - 0.5 * volatility ** 2) + volatility * shock)
+
+    # Draw every shock at once and accumulate the log-returns, instead of
+    # stepping the recursion prices[t] = prices[t - 1] * exp(...) in Python.
+    mu = drift - 0.5 * volatility * volatility
+    log_increments = rng.standard_normal(num_steps - 1)
+    # Turn the shocks into log-returns in place, without temporary arrays
+    log_increments *= volatility
+    log_increments += mu
+    np.cumsum(log_increments, out=log_increments)
+    np.exp(log_increments, out=log_increments)
+    np.multiply(log_increments, start_price, out=prices[1:])
 
     return prices
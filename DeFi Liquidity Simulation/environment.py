@@ -5,13 +5,21 @@ Orchestrates the simulation: it holds the AMM, the agents, and the external
 reference price data. At each step, it updates the environment based on agent actions.
 """
 
+from types import SimpleNamespace
+
 import numpy as np
 
+from actions import TRADE, ADD_LIQUIDITY, REMOVE_LIQUIDITY, BUY
+from agents import BaseAgentPool
+from amms import ConstantProductAMM
+from kernels import KERNEL_RL_LP, simulate
+
+
 class MarketEnvironment:
     def __init__(self, amm, agents, reference_prices):
         """
         amm (BaseAMM): An AMM instance.
-        agents (list): A list of agent instances.
+        agents (list): A list of agent instances and/or agent pools.
         reference_prices (np.array): The external "true" or reference market price.
         """
         self.amm = amm
@@ -20,69 +28,94 @@ class MarketEnvironment:
         self.num_steps = len(reference_prices)
         self.current_step = 0
         self.rewards = {}
-        for agent in agents:
-            self.rewards[agent.name] = 0.0
+        for name in self._agent_names():
+            self.rewards[name] = 0.0
 
         self.total_volume_tokenA = 0.0
         self.total_volume_tokenB = 0.0
+        self.amm_price_history = np.zeros(self.num_steps)
+
+        # State passed to every agent's `act`, updated in place each step
+        self._state = SimpleNamespace(amm_price=0.0, reference_price=0.0, step=0)
 
     def reset(self):
         self.current_step = 0
-        for agent in self.agents:
-            self.rewards[agent.name] = 0.0
+        for name in self._agent_names():
+            self.rewards[name] = 0.0
         self.total_volume_tokenA = 0.0
         self.total_volume_tokenB = 0.0
+        self.amm_price_history = np.zeros(self.num_steps)
+
+    def _agent_names(self):
+        names = []
+        for agent in self.agents:
+            if isinstance(agent, BaseAgentPool):
+                names.extend(agent.names)
+            else:
+                names.append(agent.name)
+        return names
+
+    def _execute_trade(self, name, amount_in, direction, current_price):
+        tokens_received = self.amm.swap(amount_in, direction)
+        if direction == BUY:
+            # cost in "B" is amount_in
+            cost_ref = amount_in
+            value_ref = tokens_received * current_price
+            self.rewards[name] += (value_ref - cost_ref)
+            self.total_volume_tokenB += amount_in
+        else:
+            # direction == SELL
+            cost_ref = amount_in * current_price
+            value_ref = tokens_received
+            self.rewards[name] += (value_ref - cost_ref)
+            self.total_volume_tokenA += amount_in
 
     def step(self):
         if self.current_step >= self.num_steps:
             return False
 
-        current_price = self.reference_prices[self.current_step]
+        # Prices may be stored as float32; do the step's arithmetic in float64
+        current_price = float(self.reference_prices[self.current_step])
         amm_price = self.amm.get_price()
+        self.amm_price_history[self.current_step] = amm_price
 
-        env_state = {
-            "amm_price": amm_price,
-            "reference_price": current_price,
-            "step": self.current_step
-        }
+        env_state = self._state
+        env_state.amm_price = amm_price
+        env_state.reference_price = current_price
+        env_state.step = self.current_step
 
-        # Collect agent actions
-        actions = {}
+        # Collect agent actions (pools decide for all their members at once)
+        actions = []
         for agent in self.agents:
-            actions[agent.name] = agent.act(env_state)
+            if isinstance(agent, BaseAgentPool):
+                actions.append(agent.act_batch(env_state))
+            else:
+                actions.append(agent.act(env_state))
 
         # Execute actions
-        for agent in self.agents:
-            action = actions[agent.name]
-
-            if action["type"] == "trade":
-                direction = action.get("direction", "buy")
-                amount_in = action.get("amount", 0.0)
+        for agent, action in zip(self.agents, actions):
+            if isinstance(agent, BaseAgentPool):
+                # Pools only trade; execute their members' trades in order
+                type_codes, amounts, directions = action
+                for i in np.flatnonzero((type_codes == TRADE) & (amounts > 0)):
+                    self._execute_trade(agent.names[i], amounts[i], directions[i], current_price)
+                continue
+
+            type_code = action.type_code
+
+            if type_code == TRADE:
+                amount_in = action.amount_a
                 if amount_in > 0:
-                    tokens_received = self.amm.swap(amount_in, direction)
-                    if direction == "buy":
-                        # cost in "B" is amount_in
-                        cost_ref = amount_in
-                        value_ref = tokens_received * current_price
-                        self.rewards[agent.name] += (value_ref - cost_ref)
-                        self.total_volume_tokenB += amount_in
-                    else:
-                        # direction == "sell"
-                        cost_ref = amount_in * current_price
-                        value_ref = tokens_received
-                        self.rewards[agent.name] += (value_ref - cost_ref)
-                        self.total_volume_tokenA += amount_in
-
-            elif action["type"] == "add_liquidity":
-                amountA = action["amount_tokenA"]
-                amountB = action["amount_tokenB"]
+                    self._execute_trade(agent.name, amount_in, action.direction, current_price)
+
+            elif type_code == ADD_LIQUIDITY:
+                amountA = action.amount_a
+                amountB = action.amount_b
                 if (amountA > 0 and amountB > 0):
                     self.amm.add_liquidity(amountA, amountB)
 
-            elif action["type"] == "remove_liquidity":
-                fractionA = action["amount_tokenA"]
-                fractionB = action["amount_tokenB"]
-                fraction = min(fractionA, fractionB)  # or average them
+            elif type_code == REMOVE_LIQUIDITY:
+                fraction = min(action.amount_a, action.amount_b)  # or average them
                 result = self.amm.remove_liquidity(fraction)
                 if result is not None:
                     outA, outB = result
@@ -92,8 +125,66 @@ class MarketEnvironment:
         self.current_step += 1
         return True
 
+    def _kernel_inputs(self):
+        """
+        Collects (kinds, agent_params, q_table, rngs) for `simulate`, or returns
+        None if some agent or the AMM can't run inside the fused kernel.
+        """
+        if type(self.amm) is not ConstantProductAMM or not self.agents:
+            return None
+
+        q_policy = None
+        rows = []
+        rngs = []
+        unused_rng = None
+        for agent in self.agents:
+            params = agent.kernel_params() if hasattr(agent, "kernel_params") else None
+            if params is None:
+                return None
+            if params[0] == KERNEL_RL_LP:
+                # The kernel holds a single Q-table, so RL agents must share one policy
+                if q_policy is not None and agent.policy is not q_policy:
+                    return None
+                q_policy = agent.policy
+            rows.append(params)
+
+            # Deterministic agents get a placeholder so `rngs` stays homogeneous
+            rng = agent.kernel_rng()
+            if rng is None:
+                if unused_rng is None:
+                    unused_rng = np.random.default_rng(0)
+                rng = unused_rng
+            rngs.append(rng)
+
+        kinds = np.array([row[0] for row in rows], dtype=np.int64)
+        agent_params = np.array([row[1:] for row in rows], dtype=np.float64)
+        q_table = q_policy.q_table if q_policy is not None else np.zeros((1, 3), dtype=np.float32)
+        return kinds, agent_params, q_table, tuple(rngs)
+
     def run_simulation(self):
         self.reset()
+
+        # Fuse the whole loop if every agent supports the kernel
+        kernel_inputs = self._kernel_inputs()
+        if kernel_inputs is not None:
+            kinds, agent_params, q_table, rngs = kernel_inputs
+            (rewards, amm_price_history, reserveA, reserveB, liquidity_shares,
+             volumeA, volumeB) = simulate(
+                np.asarray(self.reference_prices), q_table, kinds, agent_params, rngs,
+                self.amm.fee_rate, self.amm.reserveA, self.amm.reserveB, self.amm.liquidity_shares
+            )
+            self.amm.reserveA = reserveA
+            self.amm.reserveB = reserveB
+            self.amm.liquidity_shares = liquidity_shares
+            for agent, reward, params in zip(self.agents, rewards, agent_params):
+                self.rewards[agent.name] += reward
+                agent.kernel_writeback(params)
+            self.total_volume_tokenA += volumeA
+            self.total_volume_tokenB += volumeB
+            self.amm_price_history = amm_price_history
+            self.current_step = self.num_steps
+            return
+
         while self.step():
             pass
 
@@ -0,0 +1,256 @@
+"""
+kernels.py
+
+Numba-compiled kernels for the AMM math, the agents' decisions and the fused
+simulation loop, plus the constants they use. They all live in this one file
+because Numba's on-disk cache only tracks the file a kernel is defined in:
+kernels that inlined functions or constants from other modules would keep a
+stale compiled copy after those modules changed.
+
+The decide kernels are also what the Python step path runs, through their
+`.py_func`, so stepped and fused simulations share one copy of each decision.
+"""
+
+import numpy as np
+from numba import njit
+
+# Action type codes
+NONE = 0
+TRADE = 1
+ADD_LIQUIDITY = 2
+REMOVE_LIQUIDITY = 3
+
+# Trade directions
+BUY = 1    # Buy Token A, spend Token B
+SELL = -1  # Sell Token A, receive Token B
+
+# Agent kinds understood by `simulate`
+KERNEL_ARBITRAGE_BOT = 0
+KERNEL_RANDOM_TRADER = 1
+KERNEL_BASIC_LP = 2
+KERNEL_RL_LP = 3
+
+# SimpleQPolicy action index -> (type_code, amount_a, amount_b, direction)
+POLICY_ACTION_ROWS = (
+    (NONE, 0.0, 0.0, 0),                  # 0: do nothing
+    (ADD_LIQUIDITY, 10.0, 10.0, 0),       # 1: add liquidity
+    (REMOVE_LIQUIDITY, 0.3, 0.3, 0),      # 2: remove some fraction of liquidity
+)
+
+# Width of a price-difference bucket; buckets span -X to +X in these increments
+PRICE_BUCKET_SIZE = 0.02
+
+
+@njit(cache=True, fastmath=True)
+def _swap_kernel(reserveA, reserveB, fee_rate, amount_in, is_buy):
+    """
+    Constant product swap math, compiled with Numba.
+    Returns (new_reserveA, new_reserveB, amount_out).
+    """
+    # K is only needed here, so it's derived from the reserves rather than stored
+    K = reserveA * reserveB
+    amount_in_after_fee = amount_in * (1.0 - fee_rate)
+    if is_buy:
+        # user inputs B, gets A
+        new_reserveB = reserveB + amount_in_after_fee
+        # x * y = k => x = K / y
+        new_reserveA = K / new_reserveB if new_reserveB != 0.0 else 0.0
+        amount_out = reserveA - new_reserveA
+    else:
+        # user inputs A, gets B
+        new_reserveA = reserveA + amount_in_after_fee
+        new_reserveB = K / new_reserveA if new_reserveA != 0.0 else 0.0
+        amount_out = reserveB - new_reserveB
+    return new_reserveA, new_reserveB, max(amount_out, 0.0)
+
+
+@njit(cache=True)
+def _add_liquidity_kernel(reserveA, reserveB, liquidity_shares, amount_tokenA, amount_tokenB):
+    """
+    Constant product deposit math, compiled with Numba.
+    Returns (new_reserveA, new_reserveB, new_liquidity_shares).
+    """
+    # If either reserve is near zero, treat as new pool
+    if reserveA < 1e-12 or reserveB < 1e-12:
+        # For simplicity: mint shares = sum of tokens
+        return amount_tokenA, amount_tokenB, liquidity_shares + (amount_tokenA + amount_tokenB)
+
+    # Otherwise, deposit in the ratio of existing reserves.
+    # Uniswap v2 mint: shares scale with the deposit relative to the reserve
+    # *before* it; reserveA >= 1e-12 here, so the division is safe.
+    # For realism, you'd revert or adjust if ratioA != ratioB, but let's proceed:
+    shares_minted = liquidity_shares * amount_tokenA / reserveA
+    new_reserveA = reserveA + amount_tokenA
+    new_reserveB = reserveB + amount_tokenB
+
+    return new_reserveA, new_reserveB, liquidity_shares + shares_minted
+
+
+@njit(cache=True)
+def _remove_liquidity_kernel(reserveA, reserveB, liquidity_shares, fraction):
+    """
+    Constant product withdrawal math, compiled with Numba. `fraction` must
+    already be clamped to [0, 0.999].
+    Returns (new_reserveA, new_reserveB, new_liquidity_shares,
+    amountA_out, amountB_out).
+    """
+    amountA_out = reserveA * fraction
+    amountB_out = reserveB * fraction
+    new_reserveA = reserveA - amountA_out
+    new_reserveB = reserveB - amountB_out
+    shares_to_burn = liquidity_shares * fraction
+    return (new_reserveA, new_reserveB, liquidity_shares - shares_to_burn,
+            amountA_out, amountB_out)
+
+
+@njit(cache=True)
+def _arb_decide(amm_price, ref_price, threshold, max_trade_size):
+    """ArbitrageBot's decision. Returns (type_code, amount_a, amount_b, direction)."""
+    # If amm_price is near zero, skip to avoid divide-by-zero in price_diff / amm_price
+    if amm_price < 1e-12:
+        return NONE, 0.0, 0.0, 0
+    price_diff = ref_price - amm_price
+    relative_diff = price_diff / amm_price
+    # +1 (BUY) if reference price > AMM price by threshold => buy from AMM cheaply
+    # -1 (SELL) if AMM price > reference price by threshold => sell to AMM
+    sign = int(relative_diff > threshold) - int(relative_diff < -threshold)
+    if sign == 0:
+        return NONE, 0.0, 0.0, 0
+    return TRADE, min(max_trade_size, abs(price_diff) * 10), 0.0, sign
+
+
+@njit(cache=True)
+def _random_trader_decide(rng, max_trade_size, trade_prob):
+    """RandomTrader's decision. Returns (type_code, amount_a, amount_b, direction)."""
+    # One draw for: whether to trade, trade size, and direction
+    u = rng.random(3)
+    if u[0] < trade_prob:
+        direction = BUY if u[2] < 0.5 else SELL
+        return TRADE, u[1] * max_trade_size, 0.0, direction
+    return NONE, 0.0, 0.0, 0
+
+
+@njit(cache=True)
+def _basiclp_decide(amm_price, ref_price, initial_liquidity, remove_threshold, has_provided):
+    """
+    BasicLiquidityProvider's decision.
+    Returns (type_code, amount_a, amount_b, direction, has_provided).
+    """
+    if not has_provided:
+        # Provide liquidity once at the start
+        return ADD_LIQUIDITY, initial_liquidity, initial_liquidity * ref_price, 0, True
+    # Possibly remove liquidity if price has changed more than threshold
+    if ref_price > 1e-12:  # avoid zero-division
+        price_diff = abs(amm_price - ref_price) / ref_price
+        if price_diff > remove_threshold:
+            # remove half the liquidity (amounts are fractions)
+            return REMOVE_LIQUIDITY, 0.5, 0.5, 0, True
+    return NONE, 0.0, 0.0, 0, True
+
+
+@njit(cache=True)
+def _state_id(price_diff, step, num_price_buckets, num_time_buckets):
+    """
+    Discretizes (reference price - AMM price, step) into a flat Q-table row:
+    price_bucket * num_time_buckets + time_bucket. Shared by
+    SimpleQPolicy._discretize_state and the fused simulation kernel.
+    """
+    bucket = int((price_diff + num_price_buckets * PRICE_BUCKET_SIZE) // PRICE_BUCKET_SIZE)
+    # Clamp with branches: cheaper than min/max calls when run as plain Python
+    if bucket < 0:
+        bucket = 0
+    elif bucket >= num_price_buckets:
+        bucket = num_price_buckets - 1
+    time_bucket = step % num_time_buckets
+    return bucket * num_time_buckets + time_bucket
+
+
+@njit(cache=True)
+def _q_policy_decide(rng, q_table, s, epsilon):
+    """SimpleQPolicy's epsilon-greedy choice in state `s`; returns the action index."""
+    if rng.random() < epsilon:
+        return rng.integers(0, 3)
+    return np.argmax(q_table[s])
+
+
+@njit(cache=True)
+def simulate(ref_prices, q_table, kinds, agent_params, rngs, fee_rate,
+             reserveA, reserveB, liquidity_shares):
+    """
+    Runs the whole MarketEnvironment step loop in a single compiled function.
+    `kinds` holds one KERNEL_* code per agent and `agent_params` the matching
+    (p0, p1, p2) rows from `kernel_params()`. `rngs` holds one Generator per
+    agent; random agents draw from (and advance) their own. Stateful
+    parameters (BasicLP's `has_provided`) are updated in place.
+    Returns (rewards, amm_price_history, reserveA, reserveB, liquidity_shares,
+    volume_tokenA, volume_tokenB).
+    """
+    num_steps = ref_prices.shape[0]
+    num_agents = kinds.shape[0]
+    rewards = np.zeros(num_agents)
+    amm_price_history = np.empty(num_steps)
+    volume_tokenA = 0.0
+    volume_tokenB = 0.0
+
+    type_codes = np.zeros(num_agents, dtype=np.int64)
+    amounts_a = np.zeros(num_agents)
+    amounts_b = np.zeros(num_agents)
+    directions = np.zeros(num_agents, dtype=np.int64)
+
+    for t in range(num_steps):
+        current_price = ref_prices[t]
+        amm_price = reserveB / reserveA if reserveA >= 1e-12 else 0.0
+        amm_price_history[t] = amm_price
+
+        # Collect agent actions
+        for i in range(num_agents):
+            kind = kinds[i]
+            if kind == KERNEL_ARBITRAGE_BOT:
+                type_codes[i], amounts_a[i], amounts_b[i], directions[i] = _arb_decide(
+                    amm_price, current_price, agent_params[i, 0], agent_params[i, 1])
+            elif kind == KERNEL_RANDOM_TRADER:
+                type_codes[i], amounts_a[i], amounts_b[i], directions[i] = _random_trader_decide(
+                    rngs[i], agent_params[i, 0], agent_params[i, 1])
+            elif kind == KERNEL_BASIC_LP:
+                type_codes[i], amounts_a[i], amounts_b[i], directions[i], has_provided = _basiclp_decide(
+                    amm_price, current_price, agent_params[i, 0], agent_params[i, 1],
+                    agent_params[i, 2] != 0.0)
+                agent_params[i, 2] = 1.0 if has_provided else 0.0
+            else:
+                s = _state_id(current_price - amm_price, t,
+                              int(agent_params[i, 0]), int(agent_params[i, 1]))
+                a = _q_policy_decide(rngs[i], q_table, s, agent_params[i, 2])
+                type_codes[i], amounts_a[i], amounts_b[i], directions[i] = POLICY_ACTION_ROWS[a]
+
+        # Execute actions
+        for i in range(num_agents):
+            type_code = type_codes[i]
+
+            if type_code == TRADE:
+                amount_in = amounts_a[i]
+                if amount_in > 0:
+                    tokens_received = 0.0
+                    if reserveA >= 1e-12 and reserveB >= 1e-12:
+                        reserveA, reserveB, tokens_received = _swap_kernel(
+                            reserveA, reserveB, fee_rate, amount_in, directions[i] > 0)
+                    if directions[i] == BUY:
+                        rewards[i] += tokens_received * current_price - amount_in
+                        volume_tokenB += amount_in
+                    else:
+                        rewards[i] += tokens_received - amount_in * current_price
+                        volume_tokenA += amount_in
+
+            elif type_code == ADD_LIQUIDITY:
+                if amounts_a[i] > 0 and amounts_b[i] > 0:
+                    reserveA, reserveB, liquidity_shares = _add_liquidity_kernel(
+                        reserveA, reserveB, liquidity_shares, amounts_a[i], amounts_b[i])
+
+            elif type_code == REMOVE_LIQUIDITY:
+                fraction = min(min(amounts_a[i], amounts_b[i]), 0.999)
+                if fraction >= 0:
+                    reserveA, reserveB, liquidity_shares, outA, outB = _remove_liquidity_kernel(
+                        reserveA, reserveB, liquidity_shares, fraction)
+                    rewards[i] += outA * current_price + outB
+
+    return (rewards, amm_price_history, reserveA, reserveB, liquidity_shares,
+            volume_tokenA, volume_tokenB)
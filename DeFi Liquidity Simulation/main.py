@@ -1,5 +1,17 @@
+import copy
+import multiprocessing
+import os
+import sys
+from types import SimpleNamespace
+
 import matplotlib
-matplotlib.use("TkAgg")
+
+# Headless batch runs (DEFI_BATCH=1, --batch, or Linux without a display)
+# use the non-interactive Agg backend and save figures instead of showing them.
+BATCH_MODE = (bool(os.environ.get("DEFI_BATCH"))
+              or "--batch" in sys.argv[1:]
+              or (sys.platform.startswith("linux") and not os.environ.get("DISPLAY")))
+matplotlib.use("Agg" if BATCH_MODE else "TkAgg")
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -11,55 +23,115 @@ from rl_utils import SimpleQPolicy
 from visualizations import plot_price_series, plot_rewards, plot_amm_vs_ref
 
 
-def train_rl_agent(num_epochs=5, steps_per_epoch=300):
+def run_epoch(policy, steps_per_epoch, seed):
+    """
+    Runs one training epoch on 'policy' (a private snapshot, which keeps
+    learning online during the epoch) and returns the list of Q-learning
+    transitions it applied, in order. 'seed' is a np.random.SeedSequence.
+    """
+    price_seed, trader_seed, policy_seed = seed.spawn(3)
+    policy.reseed(policy_seed)
+    new_state = SimpleNamespace(amm_price=0.0, reference_price=0.0, step=0)
+
+    reference_prices = generate_synthetic_price_series(
+        num_steps=steps_per_epoch,
+        start_price=1.0,
+        drift=0.0,
+        volatility=0.02,
+        random_seed=price_seed
+    )
+
+    amm = ConstantProductAMM(fee_rate=0.003)
+    rl_agent = RLLiquidityProvider("RL_LP", policy=policy)
+    random_trader = RandomTrader("RandomTrader", random_seed=trader_seed)
+    env = MarketEnvironment(amm, [rl_agent, random_trader], reference_prices)
+
+    experience = []
+    env.reset()
+    while env.step():
+        reward = env.get_rewards()["RL_LP"]
+        done = (env.get_current_step() >= steps_per_epoch)
+        new_state.amm_price = amm.get_price()
+        new_state.reference_price = reference_prices[min(env.get_current_step(), steps_per_epoch-1)]
+        new_state.step = env.get_current_step()
+        transition = policy.update_q(reward, new_state, done=done)
+        if transition is not None:
+            experience.append(transition)
+    return experience
+
+
+def _run_epoch_task(args):
+    return run_epoch(*args)
+
+
+def train_rl_agent(num_epochs=5, steps_per_epoch=300, n_jobs=1, random_seed=None):
     """
     Trains the RL agent by running multiple short simulations.
-    No seeds = fully random every run (assuming fresh interpreter).
+    Epochs run in batches of 'n_jobs' worker processes (negative values count
+    back from the CPU count, joblib-style: -1 = all CPUs, -2 = all but one,
+    never fewer than one):
+    every epoch in a batch starts from a snapshot of the current Q-table, and
+    their transitions are then replayed onto the policy in epoch order.
+    With n_jobs=1 this is identical to learning online, one epoch at a time.
+    'random_seed' is an int or a np.random.SeedSequence.
+    No seed = fully random every run.
     """
     policy = SimpleQPolicy()
-
-    for _ in range(num_epochs):
-        # Generate random reference prices (no seed argument).
-        reference_prices = generate_synthetic_price_series(
-            num_steps=steps_per_epoch,
-            start_price=1.0,
-            drift=0.0,
-            volatility=0.02
-        )
-
-        amm = ConstantProductAMM(fee_rate=0.003)
-        rl_agent = RLLiquidityProvider("RL_LP", policy=policy)
-        random_trader = RandomTrader("RandomTrader")
-        env = MarketEnvironment(amm, [rl_agent, random_trader], reference_prices)
-
-        env.reset()
-        while env.step():
-            reward = env.get_rewards()["RL_LP"]
-            done = (env.get_current_step() >= steps_per_epoch)
-            new_state = {
-                "amm_price": amm.get_price(),
-                "reference_price": reference_prices[min(env.get_current_step(), steps_per_epoch-1)],
-                "step": env.get_current_step()
-            }
-            policy.update_q(reward, new_state, done=done)
+    if n_jobs == 0:
+        raise ValueError("n_jobs must be >= 1, or negative to count back from the CPU count")
+    if n_jobs < 0:
+        n_jobs = max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    # No point starting more workers than there are epochs
+    n_jobs = max(1, min(n_jobs, num_epochs))
+    if not isinstance(random_seed, np.random.SeedSequence):
+        random_seed = np.random.SeedSequence(random_seed)
+    epoch_seeds = random_seed.spawn(num_epochs)
+
+    pool = multiprocessing.Pool(n_jobs) if n_jobs > 1 else None
+    try:
+        for start in range(0, num_epochs, n_jobs):
+            tasks = [(copy.deepcopy(policy), steps_per_epoch, seed)
+                     for seed in epoch_seeds[start:start + n_jobs]]
+            if pool is None:
+                experiences = [_run_epoch_task(task) for task in tasks]
+            else:
+                experiences = pool.map(_run_epoch_task, tasks)
+
+            # Merge this batch's updates into the shared policy, in epoch order
+            for experience in experiences:
+                for transition in experience:
+                    policy.apply_transition(*transition)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
     return policy
 
 
-def run_final_simulation(policy, steps=300):
+def run_final_simulation(policy, steps=300, random_seed=None):
     """
     Runs a final simulation with multiple agents, again with random reference prices.
+    'random_seed' (an int or a np.random.SeedSequence) seeds the prices, the
+    RandomTrader and the policy's exploration, which is reseeded in place.
+    No seed = fully random every run.
     """
+    if not isinstance(random_seed, np.random.SeedSequence):
+        random_seed = np.random.SeedSequence(random_seed)
+    price_seed, trader_seed, policy_seed = random_seed.spawn(3)
+    policy.reseed(policy_seed)
+
     reference_prices = generate_synthetic_price_series(
         num_steps=steps,
         start_price=1.2,
         drift=0.0,
-        volatility=0.02
+        volatility=0.02,
+        random_seed=price_seed
     )
 
     amm = ConstantProductAMM(fee_rate=0.003)
     rl_agent = RLLiquidityProvider("RL_LP", policy=policy)
     arb_bot = ArbitrageBot("ArbBot", threshold=0.002, max_trade_size=10.0)
-    random_trader = RandomTrader("RandomTrader", max_trade_size=5.0)
+    random_trader = RandomTrader("RandomTrader", max_trade_size=5.0, random_seed=trader_seed)
     basic_lp = BasicLiquidityProvider("BasicLP", initial_liquidity=500.0)
 
     agents = [rl_agent, arb_bot, random_trader, basic_lp]
@@ -72,31 +144,34 @@ def run_final_simulation(policy, steps=300):
 
 def main():
     print("DeFi Liquidity Simulator - FULLY RANDOM each run!")
-    # This is just a random check to confirm that each run prints a new random number:
-    print("Random check:", np.random.rand())
+    # Fresh OS entropy every run; everything below is derived from it, so the
+    # printed seed is enough to reproduce the run
+    seed = np.random.SeedSequence()
+    print("Run seed:", seed.entropy)
+    train_seed, final_seed = seed.spawn(2)
 
     # Train RL agent
-    policy = train_rl_agent(num_epochs=5, steps_per_epoch=300)
+    policy = train_rl_agent(num_epochs=5, steps_per_epoch=300, random_seed=train_seed)
 
     # Run final simulation
-    ref_prices, env, final_rewards = run_final_simulation(policy, steps=300)
+    ref_prices, env, final_rewards = run_final_simulation(policy, steps=300, random_seed=final_seed)
     print("Final Rewards:", final_rewards)
 
     # Visualize
-    plot_price_series(ref_prices)
+    plot_price_series(ref_prices, save_path="price_series.png" if BATCH_MODE else None)
 
-    # Dummy AMM price trace for illustration
-    amm_prices = []
+    # Dummy AMM price trace for illustration. Depositing (1.0, p) for every
+    # reference price p makes the pool price the running mean of ref_prices,
+    # so the trace is computed in one pass instead of replaying the deposits.
     dummy_amm = ConstantProductAMM()
-    amm_prices.append(dummy_amm.get_price())
-    for p in ref_prices:
-        dummy_amm.add_liquidity(1.0, p)
-        amm_prices.append(dummy_amm.get_price())
+    amm_prices = np.empty(len(ref_prices) + 1)
+    amm_prices[0] = dummy_amm.get_price()
+    amm_prices[1:] = np.cumsum(ref_prices, dtype=np.float64) / np.arange(1, len(ref_prices) + 1)
 
-    plot_amm_vs_ref(amm_prices, ref_prices)
+    plot_amm_vs_ref(amm_prices, ref_prices, save_path="amm_vs_ref.png" if BATCH_MODE else None)
 
     agent_names = list(final_rewards.keys())
-    plot_rewards(agent_names, final_rewards)
+    plot_rewards(agent_names, final_rewards, save_path="rewards.png" if BATCH_MODE else None)
 
 
 if __name__ == "__main__":
@@ -2,10 +2,23 @@
 
 import numpy as np
 
+from actions import Action
+from kernels import POLICY_ACTION_ROWS, PRICE_BUCKET_SIZE, _state_id, _q_policy_decide
+
+# Action index -> Action returned to the environment
+POLICY_ACTIONS = tuple(Action._make(row) for row in POLICY_ACTION_ROWS)
+
+# The policy runs the kernels' plain-Python source, like the agents' `act`:
+# the fused simulation uses the compiled versions
+_state_id_py = _state_id.py_func
+_q_policy_decide_py = _q_policy_decide.py_func
+
+
 class SimpleQPolicy:
     """
     A minimal Q-learning approach for the RLLiquidityProvider:
-    - State: (discretized price difference, step mod 10, etc.)
+    - State: (discretized price difference, step mod 10, etc.), flattened
+      into a single state id = price_bucket * num_time_buckets + time_bucket
     - Actions: [0: do nothing, 1: add liquidity, 2: remove liquidity]
     """
 
@@ -17,12 +30,12 @@ class SimpleQPolicy:
                  epsilon=0.1,    # exploration rate
                  random_seed=None):
         """
-        If 'random_seed' is None, we do not seed the global RNG.
-        If 'random_seed' is an integer, we call np.random.seed(...) so that
-        this policy's behavior is reproducible.
+        Exploration draws come from this policy's own PCG64 Generator.
+        If 'random_seed' is an integer, the generator is seeded with it so that
+        this policy's behavior is reproducible; if None, it is seeded from
+        fresh OS entropy. The global NumPy RNG state is never touched.
         """
-        if random_seed is not None:
-            np.random.seed(random_seed)
+        self._rng = np.random.default_rng(random_seed)
 
         self.num_price_buckets = num_price_buckets
         self.num_time_buckets = num_time_buckets
@@ -30,78 +43,101 @@ class SimpleQPolicy:
         self.gamma = gamma
         self.epsilon = epsilon
 
-        # Q-table shape = (price_bucket, time_bucket, action)
-        self.q_table = np.zeros((self.num_price_buckets, self.num_time_buckets, 3))
+        # Q-table shape = (state_id, action); all time buckets of a price
+        # bucket are contiguous rows. float32 is ample for the value estimates.
+        self.q_table = np.zeros((self.num_price_buckets * self.num_time_buckets, 3), dtype=np.float32)
 
         self.last_state = None
         self.last_action = None
 
     def _discretize_state(self, env_state):
         # Discretize the difference between ref_price and amm_price
-        price_diff = env_state["reference_price"] - env_state["amm_price"]
-        # For demonstration, bucket from -X to +X in 0.02 increments
-        bucket_size = 0.02
-        bucket = int((price_diff + self.num_price_buckets * bucket_size) // bucket_size)
-        bucket = max(0, min(self.num_price_buckets - 1, bucket))
+        price_diff = float(env_state.reference_price - env_state.amm_price)
+        return _state_id_py(price_diff, env_state.step, self.num_price_buckets, self.num_time_buckets)
 
-        time_bucket = env_state["step"] % self.num_time_buckets
-        return (bucket, time_bucket)
+    def _discretize_states(self, ref_prices, amm_prices, steps):
+        """
+        Vectorized `_discretize_state` over arrays of reference prices, AMM
+        prices and steps. Returns the state ids as an int32 array.
+        """
+        price_diff = np.asarray(ref_prices) - np.asarray(amm_prices)
+        buckets = np.floor_divide(price_diff + self.num_price_buckets * PRICE_BUCKET_SIZE,
+                                  PRICE_BUCKET_SIZE)
+        buckets = np.clip(buckets, 0, self.num_price_buckets - 1).astype(np.int32)
+
+        time_buckets = (np.asarray(steps) % self.num_time_buckets).astype(np.int32)
+        return buckets * np.int32(self.num_time_buckets) + time_buckets
+
+    def greedy_actions(self, ref_prices, amm_prices, steps):
+        """
+        Greedy (no exploration, no learning) action index for every state in
+        a batch, e.g. to evaluate the learned policy along a whole price path.
+        """
+        state_ids = self._discretize_states(ref_prices, amm_prices, steps)
+        return np.argmax(self.q_table[state_ids], axis=1)
 
     def select_action(self, env_state):
         # Convert env_state to discrete
         s = self._discretize_state(env_state)
 
         # Epsilon-greedy
-        if np.random.rand() < self.epsilon:
-            a = np.random.randint(0, 3)
-        else:
-            a = np.argmax(self.q_table[s[0], s[1], :])
+        a = int(_q_policy_decide_py(self._rng, self.q_table, s, self.epsilon))
 
         # Store for learning
         self.last_state = s
         self.last_action = a
 
-        if a == 0:
-            # do nothing
-            return {
-                "type": "none",
-                "amount_tokenA": 0.0,
-                "amount_tokenB": 0.0
-            }
-        elif a == 1:
-            # add liquidity
-            return {
-                "type": "add_liquidity",
-                "amount_tokenA": 10.0,
-                "amount_tokenB": 10.0
-            }
-        else:
-            # remove some fraction of liquidity
-            return {
-                "type": "remove_liquidity",
-                "amount_tokenA": 0.3,  # fraction
-                "amount_tokenB": 0.3
-            }
+        return POLICY_ACTIONS[a]
+
+    def reseed(self, random_seed):
+        """
+        Replace the exploration Generator, e.g. to give each per-epoch policy
+        snapshot in training its own independent stream.
+        """
+        self._rng = np.random.default_rng(random_seed)
+
+    def kernel_params(self):
+        """
+        Parameters for `_q_policy_decide` in the fused simulation kernel,
+        which reads `self.q_table` directly.
+        """
+        return (float(self.num_price_buckets), float(self.num_time_buckets), self.epsilon)
+
+    def kernel_rng(self):
+        """Generator used for exploration draws inside the fused kernel."""
+        return self._rng
 
     def update_q(self, reward, new_env_state, done=False):
         """
         Called after each step to update Q-table via Q-learning.
         If 'done', treat next state's value as 0 (no future rewards).
+        Returns the applied transition (s, a, reward, s_next), with s_next None
+        when done, so it can be replayed onto another policy via `apply_transition`.
         """
         if self.last_state is None:
-            return
+            return None
 
         s = self.last_state
         a = self.last_action
-
-        if done:
-            target = reward
-        else:
-            s_next = self._discretize_state(new_env_state)
-            target = reward + self.gamma * np.max(self.q_table[s_next[0], s_next[1], :])
-
-        self.q_table[s[0], s[1], a] += self.alpha * (target - self.q_table[s[0], s[1], a])
+        s_next = None if done else self._discretize_state(new_env_state)
+        self.apply_transition(s, a, reward, s_next)
 
         # Clear the stored state/action
         self.last_state = None
         self.last_action = None
+        return s, a, reward, s_next
+
+    def apply_transition(self, s, a, reward, s_next):
+        """
+        Q-learning update for a single discretized transition.
+        If 's_next' is None, treat next state's value as 0 (no future rewards).
+        """
+        if s_next is None:
+            target = reward
+        else:
+            # Built-in max over the 3 action values; np.max's call overhead
+            # outweighs the work at this size
+            target = reward + self.gamma * max(self.q_table[s_next].tolist())
+
+        row = self.q_table[s]
+        row[a] += self.alpha * (target - row[a])
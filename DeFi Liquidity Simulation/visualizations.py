@@ -1,17 +1,29 @@
 import matplotlib.pyplot as plt
 
-def plot_price_series(reference_prices):
+def _show_or_save(save_path):
+    """
+    Show the current figure, or write it to 'save_path' and close it
+    (for headless runs on the Agg backend).
+    """
+    if save_path is None:
+        plt.show()
+    else:
+        plt.savefig(save_path)
+        plt.close()
+
+def plot_price_series(reference_prices, save_path=None):
     plt.figure()
     plt.title("Reference Price Series")
     plt.xlabel("Timestep")
     plt.ylabel("Price")
     plt.plot(reference_prices)
-    plt.show()
+    _show_or_save(save_path)
 
-def plot_rewards(agent_names, rewards):
+def plot_rewards(agent_names, rewards, save_path=None):
     """
     agent_names (list of str)
     rewards (dict): final reward for each agent's name
+    save_path (str, optional): save the figure here instead of showing it
     """
     plt.figure()
     plt.title("Final Agent Rewards")
@@ -23,9 +35,9 @@ def plot_rewards(agent_names, rewards):
     plt.bar(x, y)
     plt.xticks(x, agent_names, rotation=45)
     plt.tight_layout()
-    plt.show()
+    _show_or_save(save_path)
 
-def plot_amm_vs_ref(amm_prices, ref_prices):
+def plot_amm_vs_ref(amm_prices, ref_prices, save_path=None):
     plt.figure()
     plt.title("AMM Price vs Reference Price")
     plt.xlabel("Timestep")
@@ -33,4 +45,4 @@ def plot_amm_vs_ref(amm_prices, ref_prices):
     plt.plot(ref_prices, label="Reference Price")
     plt.plot(amm_prices, label="AMM Price")
     plt.legend()
-    plt.show()
+    _show_or_save(save_path)